@@ -1,17 +1,47 @@
 #!/usr/bin/env python
-import sys, json, argparse, pathlib
-from coach.scorer import score_and_improve
+import sys, argparse, logging, pathlib
+import orjson
 
-def main():
-    ap = argparse.ArgumentParser(description="Prompt Coach (AI Prompt Optimizer)")
+def batch_main(argv):
+    ap = argparse.ArgumentParser(prog="coach batch",
+                                 description="Score many prompts offline via the OpenAI Batch API")
+    ap.add_argument("--input", "-i", required=True, help="Prompts file, one prompt per line")
+    ap.add_argument("--output", "-o", required=True, help="Path to write JSONL results (one per prompt)")
+    ap.add_argument("--pack", action="store_true",
+                    help="Return now: pack several prompts into each chat request instead of using the Batch API")
+    args = ap.parse_args(argv)
+
+    # Imported after argument parsing so --help and usage errors stay fast
+    from coach.scorer import score_and_improve_batch, score_and_improve_multi
+    # Batch ids and poll status go to stderr so an interrupted run can be found later
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+
+    lines = pathlib.Path(args.input).read_text(encoding="utf-8").splitlines()
+    prompts = [line.strip() for line in lines if line.strip()]
+    results = score_and_improve_multi(prompts) if args.pack else score_and_improve_batch(prompts)
+
+    out_path = pathlib.Path(args.output)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with out_path.open("wb") as fh:
+        for res in results:
+            fh.write(orjson.dumps(res, option=orjson.OPT_APPEND_NEWLINE))
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "batch":
+        return batch_main(argv[1:])
+
+    ap = argparse.ArgumentParser(description="Prompt Coach (AI Prompt Optimizer)",
+                                 epilog="Bulk mode: coach batch --input prompts.txt --output results.jsonl")
     ap.add_argument("--file", "-f", help="Read prompt from file (otherwise stdin)")
     ap.add_argument("--print-improved", dest="print_improved", action="store_true",
                     help="Print improved prompt only")
     ap.add_argument("--show-diff", dest="show_diff", action="store_true",
                     help="Show unified diff between original and improved")
     ap.add_argument("--write", "-w", help="Path to write improved prompt")
-    args = ap.parse_args()
+    args = ap.parse_args(argv)
 
+    from coach.scorer import score_and_improve
     raw = pathlib.Path(args.file).read_text(encoding="utf-8") if args.file else sys.stdin.read()
     res = score_and_improve(raw)
 
@@ -28,7 +58,7 @@ def main():
         out_path.parent.mkdir(parents=True, exist_ok=True)
         out_path.write_text(res["improved"], encoding="utf-8")
 
-    print(json.dumps(res, indent=2, ensure_ascii=False))
+    sys.stdout.buffer.write(orjson.dumps(res, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE))
 
 if __name__ == "__main__":
     main()
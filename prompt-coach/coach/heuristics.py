@@ -1,7 +1,7 @@
 import re
 from dataclasses import dataclass
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class HeuristicScores:
     clarity: int
     context: int
@@ -17,14 +17,34 @@ KEY_SIGNS = {
     "accept": r"\bAcceptance\b|\bAcceptance Criteria\b|\btests\b|\bvalidation\b",
 }
 
+# Lowercase; matched against the lowercased prompt, so keyword checks are case-insensitive.
+CONTEXT_KEYWORDS = ("rhel", "postgresql", "python", "ansible", "versions", "constraints")
+CONSTRAINT_KEYWORDS = ("idempotent", "no shell", "lint", "type hints", "security")
+# "rls" must start a word ("curls" is not RLS); no trailing boundary so "RLS-enabled" still counts.
+CONSTRAINT_ACRONYMS = ("rls",)
+
+# Compiled once at import.
+_FORMAT_RE = re.compile(KEY_SIGNS["format"], re.I)
+_GUARDRAILS_RE = re.compile(KEY_SIGNS["guardrails"], re.I)
+_ACCEPT_RE = re.compile(KEY_SIGNS["accept"], re.I)
+_CONSTRAINT_ACRONYMS_RE = re.compile(r"\b(?:" + "|".join(CONSTRAINT_ACRONYMS) + ")")
+
+def _has_keyword(t_lower: str, keywords: tuple, acronyms: tuple = (), acronyms_re: re.Pattern | None = None) -> bool:
+    if any(k in t_lower for k in keywords):
+        return True
+    # Substring test first; the regex only runs when an acronym appears at all
+    return any(a in t_lower for a in acronyms) and acronyms_re.search(t_lower) is not None
+
 def score_prompt(text: str) -> HeuristicScores:
     t = text.strip()
+    t_lower = t.lower()
     clarity = 20 if len(t.split()) >= 6 and ("Task:" in t or "Write" in t or "Create" in t) else 12
-    context = 20 if any(k in t for k in ["RHEL","PostgreSQL","Python","Ansible","versions","constraints"]) else 8
-    constraints = 15 if any(k in t for k in ["idempotent","no shell","lint","type hints","RLS","security"]) else 7
-    format_contract = 20 if re.search(KEY_SIGNS["format"], t, re.I) else 8
-    guardrails = 15 if re.search(KEY_SIGNS["guardrails"], t, re.I) else 6
-    acceptance = 10 if re.search(KEY_SIGNS["accept"], t, re.I) else 4
+    context = 20 if _has_keyword(t_lower, CONTEXT_KEYWORDS) else 8
+    constraints = 15 if _has_keyword(t_lower, CONSTRAINT_KEYWORDS, CONSTRAINT_ACRONYMS,
+                                     _CONSTRAINT_ACRONYMS_RE) else 7
+    format_contract = 20 if _FORMAT_RE.search(t) else 8
+    guardrails = 15 if _GUARDRAILS_RE.search(t) else 6
+    acceptance = 10 if _ACCEPT_RE.search(t) else 4
     return HeuristicScores(clarity, context, constraints, format_contract, guardrails, acceptance)
 
 def total(h: HeuristicScores) -> int:
@@ -1,50 +1,360 @@
-import os, json
-from typing import Dict, Any, Tuple
-from openai import OpenAI
-from .utils import get_model, get_timeout, ModelUsage, safe_json_loads
-from dotenv import load_dotenv
-load_dotenv()
-
-def get_client() -> OpenAI:
+import os, json, asyncio, hashlib, logging, time
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Any, Tuple, List, Optional, Iterator
+import orjson
+from tenacity import (retry, retry_if_exception, wait_random_exponential, stop_after_attempt,
+                      before_sleep_log)
+from .utils import (get_model, get_timeout, get_concurrency, get_context_tokens, get_multi_size,
+                    count_tokens, ModelUsage, safe_json_loads)
+
+# The OpenAI SDK (and httpx/pydantic behind it) is imported lazily when the
+# first client is built, keeping CLI start-up and heuristics-only use cheap.
+if TYPE_CHECKING:
+    from openai import OpenAI, AsyncOpenAI
+
+# Only look for a .env file when the key isn't already in the environment
+if os.environ.get("OPENAI_API_KEY") is None:
+    from dotenv import load_dotenv
+    load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Retries on 429 / 5xx / connection errors / timeouts: jittered exponential backoff
+# so concurrent callers don't retry in lockstep.
+RETRY_ATTEMPTS = 6
+RETRY_MAX_WAIT = 60
+
+# Batch API polling (offline bulk scoring, 24h completion window)
+BATCH_POLL_INTERVAL = 30.0
+BATCH_TERMINAL = {"completed", "failed", "expired", "cancelled"}
+
+def _api_key() -> str:
     key = os.environ.get("OPENAI_API_KEY")
     if not key:
         raise RuntimeError("OPENAI_API_KEY not set")
-    return OpenAI(api_key=key)
+    return key
 
-def judge_and_rewrite(system_prompt: str, user_prompt: str) -> Tuple[Dict[str, Any], ModelUsage]:
-    client = get_client()
-    model = get_model()
-    timeout = get_timeout()
+# Clients are cached per API key so the HTTP connection pool (TCP + TLS
+# handshakes) is reused across calls; a new key (e.g. set from the UI) gets a new client.
+@lru_cache(maxsize=1)
+def _client_for(key: str) -> "OpenAI":
+    import httpx
+    from openai import OpenAI
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        timeout=get_timeout(),
+    )
+    # max_retries=0: tenacity (_with_retry) is the only retry layer
+    return OpenAI(api_key=key, http_client=http_client, max_retries=0)
+
+# Async clients are also bound to the running event loop: connections opened on
+# one loop cannot be reused from another (e.g. successive asyncio.run calls).
+# HTTP/2 lets all concurrent requests multiplex over a single connection.
+@lru_cache(maxsize=1)
+def _async_client_for(key: str, loop: asyncio.AbstractEventLoop) -> "AsyncOpenAI":
+    import httpx
+    from openai import AsyncOpenAI
+    http_client = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        timeout=get_timeout(),
+    )
+    return AsyncOpenAI(api_key=key, http_client=http_client, max_retries=0)
+
+def get_client() -> "OpenAI":
+    return _client_for(_api_key())
+
+def get_async_client() -> "AsyncOpenAI":
+    return _async_client_for(_api_key(), asyncio.get_running_loop())
+
+@lru_cache(maxsize=8)
+def _prompt_cache_key(system_prompt: str) -> str:
+    # Routes requests sharing the system prompt to the same prompt-cache shard
+    return "prompt-coach-" + hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
 
-    # Prepare base request parameters
-    request_params = {
+def _request_params(system_prompt: str, user_prompt: str, model: str) -> Dict[str, Any]:
+    # The system prompt is static and always first so OpenAI's automatic prompt
+    # caching can reuse it; only the user message varies between calls.
+    return {
         "model": model,
         "messages": [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
         ],
         "response_format": {"type": "json_object"},
-        "timeout": timeout,
+        "timeout": get_timeout(),
         "temperature": 0.2,  # Try with custom temperature first
+        "prompt_cache_key": _prompt_cache_key(system_prompt),
     }
 
+def _unsupported_temperature(e: "Exception | str") -> bool:
+    return "temperature" in str(e) and "unsupported" in str(e).lower()
+
+def _retryable(e: BaseException) -> bool:
+    from openai import RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+    return isinstance(e, (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError))
+
+_with_retry = retry(
+    retry=retry_if_exception(_retryable),
+    wait=wait_random_exponential(min=1, max=RETRY_MAX_WAIT),
+    stop=stop_after_attempt(RETRY_ATTEMPTS),
+    before_sleep=before_sleep_log(logger, logging.WARNING),
+    reraise=True,
+)
+
+@_with_retry
+def _create(client: "OpenAI", **params: Any) -> Any:
+    return client.chat.completions.create(**params)
+
+@_with_retry
+def _call(fn: Any, *args: Any, **kwargs: Any) -> Any:
+    # Batch API file/batch calls: same retry policy as chat completions
+    return fn(*args, **kwargs)
+
+@_with_retry
+async def _acreate(client: "AsyncOpenAI", **params: Any) -> Any:
+    return await client.chat.completions.create(**params)
+
+def _create_with_fallback(client: "OpenAI", request_params: Dict[str, Any]) -> Any:
     try:
-        r = client.chat.completions.create(**request_params)
+        return _create(client, **request_params)
     except Exception as e:
         # If we get an error about unsupported temperature, retry without it
-        if "temperature" in str(e) and "unsupported" in str(e).lower():
+        if _unsupported_temperature(e):
             request_params.pop("temperature")  # Remove temperature parameter
-            r = client.chat.completions.create(**request_params)
-        else:
-            raise  # Re-raise if it's a different error
+            return _create(client, **request_params)
+        raise  # Re-raise if it's a different error
 
-    content = r.choices[0].message.content or "{}"
-    data = safe_json_loads(content)
-    u = r.usage
-    usage = ModelUsage(
+def _usage(u: Any, model: str) -> ModelUsage:
+    details = getattr(u, "prompt_tokens_details", None)
+    return ModelUsage(
         prompt_tokens=getattr(u, "prompt_tokens", 0),
         completion_tokens=getattr(u, "completion_tokens", 0),
         total_tokens=getattr(u, "total_tokens", 0),
+        cached_tokens=getattr(details, "cached_tokens", 0) or 0,
         model=model,
     )
-    return data, usage
+
+def _parse_response(r: Any, model: str) -> Tuple[Dict[str, Any], ModelUsage]:
+    content = r.choices[0].message.content or "{}"
+    data = safe_json_loads(content)
+    return data, _usage(r.usage, model)
+
+class JudgeStream:
+    """Streaming judge_and_rewrite.
+
+    Iterating yields the model's raw content deltas as they arrive; once the
+    stream is exhausted, ``result`` holds the same (data, usage) tuple that
+    judge_and_rewrite returns.
+    """
+
+    def __init__(self, system_prompt: str, user_prompt: str):
+        self.model = get_model()
+        self.request_params = _request_params(system_prompt, user_prompt, self.model)
+        self.request_params["stream"] = True
+        self.request_params["stream_options"] = {"include_usage": True}  # usage arrives on the last chunk
+        self.result: Optional[Tuple[Dict[str, Any], ModelUsage]] = None
+
+    def __iter__(self) -> Iterator[str]:
+        r = _create_with_fallback(get_client(), self.request_params)
+
+        buf: List[str] = []
+        u = None
+        for chunk in r:
+            if chunk.usage is not None:
+                u = chunk.usage
+            if chunk.choices:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    buf.append(delta)
+                    yield delta
+
+        self.result = safe_json_loads("".join(buf) or "{}"), _usage(u, self.model)
+
+def judge_and_rewrite(system_prompt: str, user_prompt: str) -> Tuple[Dict[str, Any], ModelUsage]:
+    stream = JudgeStream(system_prompt, user_prompt)
+    for _ in stream:
+        pass
+    assert stream.result is not None
+    return stream.result
+
+async def judge_and_rewrite_async(
+    system_prompt: str, user_prompt: str, client: Optional["AsyncOpenAI"] = None
+) -> Tuple[Dict[str, Any], ModelUsage]:
+    client = client or get_async_client()
+    model = get_model()
+    request_params = _request_params(system_prompt, user_prompt, model)
+
+    try:
+        r = await _acreate(client, **request_params)
+    except Exception as e:
+        if _unsupported_temperature(e):
+            request_params.pop("temperature")
+            r = await _acreate(client, **request_params)
+        else:
+            raise
+
+    return _parse_response(r, model)
+
+async def judge_and_rewrite_many(
+    system_prompt: str, user_prompts: List[str], max_concurrent: Optional[int] = None
+) -> List[Tuple[Dict[str, Any], ModelUsage]]:
+    """Run judge_and_rewrite_async over many prompts, at most max_concurrent in flight.
+
+    A prompt whose request fails (after retries) yields a dict with only an
+    "error" entry, so one bad item doesn't discard the rest.
+    """
+    client = get_async_client()
+    sem = asyncio.Semaphore(max_concurrent or get_concurrency())
+
+    async def one(p: str) -> Tuple[Dict[str, Any], ModelUsage]:
+        async with sem:
+            try:
+                return await judge_and_rewrite_async(system_prompt, p, client)
+            except Exception as e:
+                logger.warning("model call failed: %s", e)
+                return {"error": f"model request failed: {e}"}, ModelUsage(model=get_model())
+
+    return list(await asyncio.gather(*(one(p) for p in user_prompts)))
+
+def _batch_line(custom_id: str, system_prompt: str, user_prompt: str, model: str, temperature: bool = True) -> str:
+    body = _request_params(system_prompt, user_prompt, model)
+    body.pop("timeout")  # client-side option, not part of the request body
+    if not temperature:
+        body.pop("temperature")
+    return json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body})
+
+def _run_batch(
+    client: "OpenAI", system_prompt: str, prompts: Dict[int, str], model: str, temperature: bool, poll_interval: float
+) -> Dict[int, Tuple[Dict[str, Any], ModelUsage]]:
+    """Submit one batch, wait for it, and map each custom_id (prompt index) to its result."""
+    payload = "\n".join(_batch_line(str(i), system_prompt, p, model, temperature) for i, p in prompts.items())
+    upload = _call(client.files.create, file=("prompt-coach-batch.jsonl", payload.encode("utf-8")), purpose="batch")
+    batch = _call(
+        client.batches.create,
+        input_file_id=upload.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    # Logged so an interrupted run can be found (and its output fetched) later
+    logger.info("submitted batch %s (%d requests)", batch.id, len(prompts))
+    while batch.status not in BATCH_TERMINAL:
+        time.sleep(poll_interval)
+        batch = _call(client.batches.retrieve, batch.id)
+        logger.info("batch %s: %s", batch.id, batch.status)
+    if batch.status != "completed":
+        raise RuntimeError(f"batch {batch.id} ended with status {batch.status}")
+
+    results: Dict[int, Tuple[Dict[str, Any], ModelUsage]] = {}
+    # Successful requests land in output_file_id, failed ones in error_file_id
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        for line in _call(client.files.content, file_id).text.splitlines():
+            if not line.strip():
+                continue
+            row = orjson.loads(line)
+            i = int(row["custom_id"])
+            response = row.get("response") or {}
+            body = response.get("body") or {}
+            choices = body.get("choices") or []
+            if response.get("status_code") != 200 or not choices:
+                error = row.get("error") or body.get("error") or {}
+                results[i] = ({"error": f"batch request failed: {error.get('message', 'unknown error')}"},
+                              ModelUsage(model=model))
+                continue
+            data = safe_json_loads(choices[0]["message"].get("content") or "{}")
+            u = body.get("usage") or {}
+            results[i] = (data, ModelUsage(
+                prompt_tokens=u.get("prompt_tokens", 0),
+                completion_tokens=u.get("completion_tokens", 0),
+                total_tokens=u.get("total_tokens", 0),
+                cached_tokens=(u.get("prompt_tokens_details") or {}).get("cached_tokens", 0),
+                model=model,
+            ))
+    return results
+
+def judge_and_rewrite_batch(
+    system_prompt: str, user_prompts: List[str], poll_interval: float = BATCH_POLL_INTERVAL
+) -> List[Tuple[Dict[str, Any], ModelUsage]]:
+    """Submit prompts through the Batch API (half price, up to 24h) and block until done.
+
+    Results come back in input order; a prompt whose request failed yields a
+    dict with only an "error" entry describing the failure.
+    """
+    if not user_prompts:
+        return []  # the Batch API rejects an empty input file
+    client = get_client()
+    model = get_model()
+
+    results = _run_batch(client, system_prompt, dict(enumerate(user_prompts)), model, True, poll_interval)
+    # Same fallback as _create_with_fallback: resubmit rows the model rejected for temperature
+    retry_ids = [i for i, (data, _) in results.items() if _unsupported_temperature(data.get("error", ""))]
+    if retry_ids:
+        logger.info("resubmitting %d batch requests without temperature", len(retry_ids))
+        results.update(_run_batch(client, system_prompt, {i: user_prompts[i] for i in retry_ids},
+                                  model, False, poll_interval))
+
+    missing = ({"error": "no result returned by batch"}, ModelUsage(model=model))
+    return [results.get(i, missing) for i in range(len(user_prompts))]
+
+def _split_usage(usage: ModelUsage, n: int) -> List[ModelUsage]:
+    """Spread one request's usage over the n prompts it carried (remainder on the first)."""
+    def part(value: int, first: bool) -> int:
+        return value // n + (value % n if first else 0)
+    return [
+        ModelUsage(
+            prompt_tokens=part(usage.prompt_tokens, i == 0),
+            completion_tokens=part(usage.completion_tokens, i == 0),
+            total_tokens=part(usage.total_tokens, i == 0),
+            cached_tokens=part(usage.cached_tokens, i == 0),
+            model=usage.model,
+        )
+        for i in range(n)
+    ]
+
+def _pack(user_prompts: List[str]) -> List[List[int]]:
+    """Group prompt indexes so each request stays under half the context window."""
+    budget = get_context_tokens() // 2
+    max_items = get_multi_size()
+    chunks: List[List[int]] = []
+    current: List[int] = []
+    used = 0
+    for i, p in enumerate(user_prompts):
+        n = count_tokens(p)
+        if current and (used + n > budget or len(current) >= max_items):
+            chunks.append(current)
+            current, used = [], 0
+        current.append(i)
+        used += n
+    if current:
+        chunks.append(current)
+    return chunks
+
+def judge_and_rewrite_multi(
+    system_prompt: str, user_prompts: List[str]
+) -> List[Optional[Tuple[Dict[str, Any], ModelUsage]]]:
+    """Judge several prompts per request, packed as {"items": [{"id", "prompt"}]}.
+
+    system_prompt must ask for {"results": [{"id", ...}]} (see MULTI_SYSTEM_PROMPT).
+    Returns one entry per prompt in input order; None where the model's
+    response had no result for that id, so the caller can fall back.
+    """
+    results: List[Optional[Tuple[Dict[str, Any], ModelUsage]]] = [None] * len(user_prompts)
+    for chunk in _pack(user_prompts):
+        items = [{"id": i, "prompt": user_prompts[i]} for i in chunk]
+        data, usage = judge_and_rewrite(system_prompt, orjson.dumps({"items": items}).decode("utf-8"))
+        by_id: Dict[int, Dict[str, Any]] = {}
+        for item in data.get("results") or []:
+            try:
+                by_id[int(item["id"])] = item
+            except (KeyError, TypeError, ValueError):
+                continue
+        shares = iter(_split_usage(usage, len(chunk)))
+        for i in chunk:
+            share = next(shares)
+            if i in by_id:
+                item = dict(by_id[i])
+                item.pop("id", None)
+                results[i] = (item, share)
+    return results
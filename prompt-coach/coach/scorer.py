@@ -1,18 +1,120 @@
-from typing import Dict, Any
+import asyncio, copy, json, random
+from functools import lru_cache
+from collections import OrderedDict
+from hashlib import blake2b
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple, Iterator
 from .heuristics import score_prompt, total
-from .templates import SYSTEM_PROMPT
-from .openai_client import judge_and_rewrite
-from .utils import unified_diff
+from .templates import SYSTEM_PROMPT, MULTI_SYSTEM_PROMPT
+from .openai_client import (JudgeStream, judge_and_rewrite, judge_and_rewrite_async, judge_and_rewrite_many,
+                            judge_and_rewrite_batch, judge_and_rewrite_multi)
+from .utils import (unified_diff, ModelUsage, get_model, cache_enabled, get_cache_size,
+                    get_cache_sample_rate, get_cache_dir, get_context_tokens, get_response_tokens,
+                    count_tokens, truncate_to_tokens)
 
-def score_and_improve(raw_prompt: str) -> Dict[str, Any]:
-    h = score_prompt(raw_prompt)
-    local_score = total(h)
+# In-process LRU of model results, enabled with PROMPT_COACH_CACHE=1.
+_MODEL_CACHE: "OrderedDict[bytes, Tuple[Dict[str, Any], ModelUsage]]" = OrderedDict()
+
+# Part of every cache key, so results built with an older SYSTEM_PROMPT
+# (e.g. left in PROMPT_COACH_CACHE_DIR) are never served.
+_SYSTEM_DIGEST = blake2b(SYSTEM_PROMPT.encode("utf-8"), digest_size=16).digest()
+
+def _cache_key(raw_prompt: str, model: str) -> bytes:
+    h = blake2b(_SYSTEM_DIGEST, digest_size=16)
+    h.update(f"{model}\0{raw_prompt}".encode("utf-8"))
+    return h.digest()
+
+def _evict() -> None:
+    while len(_MODEL_CACHE) > get_cache_size():
+        _MODEL_CACHE.popitem(last=False)
+
+def _cache_get(key: bytes) -> Optional[Tuple[Dict[str, Any], ModelUsage]]:
+    hit = _MODEL_CACHE.get(key)
+    cache_dir = get_cache_dir()
+    if hit is None and cache_dir:
+        path = Path(cache_dir) / f"{key.hex()}.json"
+        if path.is_file():
+            try:
+                stored = json.loads(path.read_text(encoding="utf-8"))
+                hit = (stored["data"], ModelUsage(model=stored.get("model", "")))
+                _MODEL_CACHE[key] = hit
+                _evict()
+            except (OSError, ValueError, KeyError):
+                hit = None
+    if hit is None:
+        return None
+    _MODEL_CACHE.move_to_end(key)
+    # A hit costs no tokens; hand out a copy so callers can't mutate the cache
+    return copy.deepcopy(hit[0]), ModelUsage(model=hit[1].model)
+
+def _cache_lookup(raw_prompt: str) -> Tuple[Optional[bytes], Optional[Tuple[Dict[str, Any], ModelUsage]]]:
+    """(key, hit) for raw_prompt; key is None when caching is disabled."""
+    if not cache_enabled():
+        return None, None
+    key = _cache_key(raw_prompt, get_model())
+    return key, _cache_get(key)
 
-    model_data, usage = judge_and_rewrite(SYSTEM_PROMPT, raw_prompt)
+def _cache_put(key: Optional[bytes], model_data: Dict[str, Any], usage: ModelUsage) -> None:
+    if key is None or random.random() >= get_cache_sample_rate():
+        return
+    _MODEL_CACHE[key] = (copy.deepcopy(model_data), usage)
+    _MODEL_CACHE.move_to_end(key)
+    _evict()
+    cache_dir = get_cache_dir()
+    if cache_dir:
+        try:
+            Path(cache_dir).mkdir(parents=True, exist_ok=True)
+            (Path(cache_dir) / f"{key.hex()}.json").write_text(
+                json.dumps({"data": model_data, "model": usage.model}), encoding="utf-8")
+        except OSError:
+            pass  # the disk layer is best effort
+
+@lru_cache(maxsize=4)
+def _system_tokens(model: str) -> int:
+    return count_tokens(SYSTEM_PROMPT, model)
+
+def _fit_prompt(raw_prompt: str) -> Tuple[str, Optional[str]]:
+    """Truncate the prompt locally so it fits the context window before it is sent.
+
+    Returns the text to send and a note for the result when it was cut.
+    """
+    window = get_context_tokens() - get_response_tokens()
+    # Bytes bound tokens from above (see truncate_to_tokens); most prompts are
+    # far under the window, so skip loading the tokenizer for the system prompt.
+    if len(raw_prompt) * 4 <= window or len(raw_prompt.encode("utf-8")) <= window:
+        return raw_prompt, None
+    model = get_model()
+    budget = window - _system_tokens(model)
+    text, truncated = truncate_to_tokens(raw_prompt, budget, model)
+    if not truncated:
+        return text, None
+    return text, f"Prompt truncated to {budget} tokens before scoring to fit the model context window."
+
+def _usage_dict(usage: ModelUsage) -> Dict[str, Any]:
+    return {
+        "model": usage.model,
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens,
+        "cached_tokens": usage.cached_tokens,
+    }
+
+def _assemble(raw_prompt: str, local_score: int, model_data: Dict[str, Any], usage: ModelUsage,
+              note: Optional[str] = None) -> Dict[str, Any]:
+    if "error" in model_data:
+        # The model never scored this prompt: no final_score or improved prompt to report
+        return {
+            "local_score": local_score,
+            "error": model_data["error"],
+            "notes": [note] if note else [],
+            "usage": _usage_dict(usage),
+        }
     model_score = model_data.get("scorecard", {}).get("total", 0)
     improved = model_data.get("improved", raw_prompt)
     verification = model_data.get("verification", [])
     notes = model_data.get("notes", [])
+    if note:
+        notes = [note, *notes]
     scorecard = model_data.get("scorecard", {})
 
     final = round((local_score + (model_score or 0)) / 2)
@@ -25,10 +127,107 @@ def score_and_improve(raw_prompt: str) -> Dict[str, Any]:
         "diff": unified_diff(raw_prompt, improved),
         "verification": verification,
         "notes": notes,
-        "usage": {
-            "model": usage.model,
-            "prompt_tokens": usage.prompt_tokens,
-            "completion_tokens": usage.completion_tokens,
-            "total_tokens": usage.total_tokens,
-        },
+        "usage": _usage_dict(usage),
     }
+
+def score_and_improve(raw_prompt: str) -> Dict[str, Any]:
+    h = score_prompt(raw_prompt)
+    local_score = total(h)
+    sent, note = _fit_prompt(raw_prompt)
+
+    key, hit = _cache_lookup(raw_prompt)
+    if hit is not None:
+        model_data, usage = hit
+    else:
+        model_data, usage = judge_and_rewrite(SYSTEM_PROMPT, sent)
+        _cache_put(key, model_data, usage)
+    return _assemble(raw_prompt, local_score, model_data, usage, note)
+
+class ScoreStream:
+    """Streaming score_and_improve for interactive UIs.
+
+    Iterating yields raw model output deltas (nothing on a cache hit); once
+    exhausted, ``result`` holds the score_and_improve dict.
+    """
+
+    def __init__(self, raw_prompt: str):
+        self.raw_prompt = raw_prompt
+        self.result: Optional[Dict[str, Any]] = None
+
+    def __iter__(self) -> Iterator[str]:
+        local_score = total(score_prompt(self.raw_prompt))
+        sent, note = _fit_prompt(self.raw_prompt)
+
+        key, hit = _cache_lookup(self.raw_prompt)
+        if hit is not None:
+            model_data, usage = hit
+        else:
+            stream = JudgeStream(SYSTEM_PROMPT, sent)
+            yield from stream
+            assert stream.result is not None
+            model_data, usage = stream.result
+            _cache_put(key, model_data, usage)
+        self.result = _assemble(self.raw_prompt, local_score, model_data, usage, note)
+
+async def score_and_improve_async(raw_prompt: str) -> Dict[str, Any]:
+    """Async score_and_improve: local heuristics run in a thread while the model call is in flight."""
+    # Truncation may run a full tiktoken encode; keep it off the event loop
+    sent, note = await asyncio.to_thread(_fit_prompt, raw_prompt)
+    key, hit = _cache_lookup(raw_prompt)
+    if hit is not None:
+        h = score_prompt(raw_prompt)
+        model_data, usage = hit
+    else:
+        h, (model_data, usage) = await asyncio.gather(
+            asyncio.to_thread(score_prompt, raw_prompt),
+            judge_and_rewrite_async(SYSTEM_PROMPT, sent),
+        )
+        _cache_put(key, model_data, usage)
+    return _assemble(raw_prompt, total(h), model_data, usage, note)
+
+async def score_and_improve_many(raw_prompts: List[str]) -> List[Dict[str, Any]]:
+    """Score many prompts with concurrent model calls (see PROMPT_COACH_CONCURRENCY)."""
+    # Heuristics and truncation (tiktoken) are CPU work; keep them off the event loop
+    local_scores, fitted = await asyncio.to_thread(
+        lambda: ([total(score_prompt(p)) for p in raw_prompts], [_fit_prompt(p) for p in raw_prompts])
+    )
+
+    lookups = [_cache_lookup(p) for p in raw_prompts]
+    results: List[Optional[Tuple[Dict[str, Any], ModelUsage]]] = [hit for _, hit in lookups]
+    misses = [i for i, r in enumerate(results) if r is None]
+    if misses:
+        fresh = await judge_and_rewrite_many(SYSTEM_PROMPT, [fitted[i][0] for i in misses])
+        for i, (model_data, usage) in zip(misses, fresh):
+            results[i] = (model_data, usage)
+            if "error" not in model_data:
+                _cache_put(lookups[i][0], model_data, usage)
+
+    return [
+        _assemble(raw, local_score, model_data, usage, note)
+        for raw, local_score, (model_data, usage), (_, note) in zip(raw_prompts, local_scores, results, fitted)
+    ]
+
+def score_and_improve_batch(raw_prompts: List[str]) -> List[Dict[str, Any]]:
+    """Score many prompts through the OpenAI Batch API; blocks until the batch completes."""
+    local_scores = [total(score_prompt(p)) for p in raw_prompts]
+    fitted = [_fit_prompt(p) for p in raw_prompts]
+    results = judge_and_rewrite_batch(SYSTEM_PROMPT, [sent for sent, _ in fitted])
+    return [
+        _assemble(raw, local_score, model_data, usage, note)
+        for raw, local_score, (model_data, usage), (_, note) in zip(raw_prompts, local_scores, results, fitted)
+    ]
+
+def score_and_improve_multi(raw_prompts: List[str]) -> List[Dict[str, Any]]:
+    """Score many prompts with several packed into each request (system prompt sent once per request).
+
+    Prompts the model drops from its packed response are re-scored one at a time.
+    """
+    local_scores = [total(score_prompt(p)) for p in raw_prompts]
+    fitted = [_fit_prompt(p) for p in raw_prompts]
+    packed = judge_and_rewrite_multi(MULTI_SYSTEM_PROMPT, [sent for sent, _ in fitted])
+    results = [r if r is not None else judge_and_rewrite(SYSTEM_PROMPT, sent)
+               for (sent, _), r in zip(fitted, packed)]
+    return [
+        _assemble(raw, local_score, model_data, usage, note)
+        for raw, local_score, (model_data, usage), (_, note) in zip(raw_prompts, local_scores, results, fitted)
+    ]
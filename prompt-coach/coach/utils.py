@@ -1,6 +1,9 @@
 from __future__ import annotations
-import os, difflib, json
+import io, os, difflib
+import orjson
 from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any
 
 def get_model() -> str:
     return os.getenv("PROMPT_COACH_MODEL", "gpt-4o-mini")
@@ -8,20 +11,94 @@ def get_model() -> str:
 def get_timeout() -> float:
     return float(os.getenv("PROMPT_COACH_TIMEOUT", "30"))
 
+def get_concurrency() -> int:
+    return max(1, int(os.getenv("PROMPT_COACH_CONCURRENCY", "10")))
+
+def get_max_batch_items() -> int:
+    # Largest list accepted by the /score_batch endpoint
+    return max(1, int(os.getenv("PROMPT_COACH_MAX_BATCH_ITEMS", "100")))
+
+def get_context_tokens() -> int:
+    return int(os.getenv("PROMPT_COACH_CONTEXT_TOKENS", "128000"))
+
+def get_response_tokens() -> int:
+    # Tokens reserved for the model's answer when sizing the prompt
+    return int(os.getenv("PROMPT_COACH_RESPONSE_TOKENS", "4096"))
+
+def get_multi_size() -> int:
+    # Max prompts packed into one request by judge_and_rewrite_multi
+    return max(1, int(os.getenv("PROMPT_COACH_MULTI_SIZE", "8")))
+
+def cache_enabled() -> bool:
+    return os.getenv("PROMPT_COACH_CACHE", "0") == "1"
+
+def get_cache_size() -> int:
+    return int(os.getenv("PROMPT_COACH_CACHE_SIZE", "512"))
+
+def get_cache_sample_rate() -> float:
+    return float(os.getenv("PROMPT_COACH_CACHE_SAMPLE_RATE", "1.0"))
+
+def get_cache_dir() -> str | None:
+    # Optional on-disk layer for cross-process reuse, e.g. ~/.cache/prompt-coach
+    d = os.getenv("PROMPT_COACH_CACHE_DIR")
+    return os.path.expanduser(d) if d else None
+
+@lru_cache(maxsize=4)
+def get_encoding(model: str) -> Any:
+    """tiktoken encoding for model, or None if tiktoken or its BPE files are unavailable."""
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    enc = get_encoding(model or get_model())
+    if enc is None:
+        return (len(text) + 3) // 4  # rough estimate: ~4 characters per token
+    return len(enc.encode(text))
+
+def truncate_to_tokens(text: str, budget: int, model: str | None = None) -> tuple[str, bool]:
+    """Cut text to at most budget tokens; returns (text, was_truncated)."""
+    budget = max(0, budget)
+    # tiktoken works on UTF-8 bytes and every token covers at least one byte,
+    # so a text no longer than the budget in bytes can't exceed it in tokens
+    # (one CJK character or emoji can be several tokens). len(text) * 4 bounds
+    # the byte length without encoding.
+    if len(text) * 4 <= budget or len(text.encode("utf-8")) <= budget:
+        return text, False
+    enc = get_encoding(model or get_model())
+    if enc is None:
+        # No tokenizer: budget bytes is a true upper bound (drop any split character)
+        return text.encode("utf-8")[:budget].decode("utf-8", errors="ignore"), True
+    tokens = enc.encode(text)
+    if len(tokens) <= budget:
+        return text, False
+    return enc.decode(tokens[:budget]), True
+
 @dataclass
 class ModelUsage:
     prompt_tokens: int = 0
     completion_tokens: int = 0
     total_tokens: int = 0
+    cached_tokens: int = 0  # prompt tokens served from OpenAI's prompt cache
     model: str = ""
 
 def unified_diff(a: str, b: str) -> str:
-    a_lines = a.splitlines(keepends=True)
-    b_lines = b.splitlines(keepends=True)
-    return "".join(difflib.unified_diff(a_lines, b_lines, fromfile="original", tofile="improved"))
+    if a == b:
+        return ""
+    # Stream hunks into one buffer instead of collecting every chunk first
+    sio = io.StringIO()
+    for chunk in difflib.unified_diff(a.splitlines(keepends=True), b.splitlines(keepends=True),
+                                      fromfile="original", tofile="improved"):
+        sio.write(chunk)
+    return sio.getvalue()
 
 def safe_json_loads(s: str) -> dict:
     try:
-        return json.loads(s)
-    except Exception:
+        return orjson.loads(s)
+    except orjson.JSONDecodeError:
         return {"scorecard": {}, "improved": s, "verification": [], "notes": ["non-json model output"]}
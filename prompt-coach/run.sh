@@ -0,0 +1,12 @@
+#!/usr/bin/env sh
+# Production entry point for the API: one worker process per core, each on
+# uvloop + httptools. Install with: pip install -e ".[server]"
+#   WEB_CONCURRENCY  worker processes (default: number of cores)
+#   PORT             listen port (default: 8088)
+# Gunicorn equivalent:
+#   gunicorn -k uvicorn.workers.UvicornWorker -w "${WEB_CONCURRENCY:-4}" -b 0.0.0.0:8088 server:app
+set -eu
+exec uvicorn server:app \
+  --host 0.0.0.0 --port "${PORT:-8088}" \
+  --loop uvloop --http httptools \
+  --workers "${WEB_CONCURRENCY:-$(nproc)}"
@@ -1,7 +1,8 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from coach.scorer import score_and_improve
+from coach.scorer import score_and_improve_async, score_and_improve_many
+from coach.utils import get_max_batch_items
 
 app = FastAPI(title="Prompt Coach API")
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
@@ -14,10 +15,23 @@ def health():
     return {"ok": True}
 
 @app.post("/score")
-def score(p: PromptIn):
-    return score_and_improve(p.text)
+async def score(p: PromptIn):
+    return await score_and_improve_async(p.text)
 
+@app.post("/score_batch")
+async def score_batch(items: list[PromptIn]):
+    if len(items) > get_max_batch_items():
+        raise HTTPException(status_code=413, detail=f"at most {get_max_batch_items()} items per request")
+    return await score_and_improve_many([i.text for i in items])
 
-# uvicorn server:app --reload --port 8088
+
+if __name__ == "__main__":
+    # Dev server on uvloop; for multi-core serving use ./run.sh
+    import uvicorn
+    uvicorn.run("server:app", port=8088, reload=True, loop="uvloop", http="httptools")
+
+# python server.py  (or: uvicorn server:app --reload --port 8088)
+# ./run.sh          (workers per core, uvloop + httptools)
 # curl -s localhost:8088/health
-# curl -s localhost:8088/score -H 'content-type: application/json' -d '{"text":"write a postgres playbook"}' | jq
\ No newline at end of file
+# curl -s localhost:8088/score -H 'content-type: application/json' -d '{"text":"write a postgres playbook"}' | jq
+# curl -s localhost:8088/score_batch -H 'content-type: application/json' -d '[{"text":"write a postgres playbook"},{"text":"tail a log"}]' | jq
\ No newline at end of file
@@ -0,0 +1,11 @@
+from coach import cli, scorer
+
+def test_batch_cli_writes_one_jsonl_line_per_prompt(monkeypatch, tmp_path):
+    monkeypatch.setattr(scorer, "score_and_improve_batch", lambda prompts: [{"improved": p} for p in prompts])
+    src = tmp_path / "prompts.txt"
+    src.write_text("write postgres stuff\n\ntail a log\n", encoding="utf-8")
+    out = tmp_path / "out" / "results.jsonl"
+
+    cli.main(["batch", "--input", str(src), "--output", str(out)])
+    lines = out.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 2 and "tail a log" in lines[1]
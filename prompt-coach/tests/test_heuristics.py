@@ -11,3 +11,33 @@ def test_heuristics_detects_format_and_guardrails():
     assert s.format_contract >= 15
     assert s.guardrails >= 10
     assert total(s) > 60
+
+def test_heuristics_keyword_buckets():
+    assert score_prompt("Create a playbook for RHEL hosts").context == 20
+    assert score_prompt("Create a playbook for hosts").context == 8
+    assert score_prompt("Keep it idempotent please").constraints == 15
+    assert score_prompt("Keep it simple please").constraints == 7
+
+def test_heuristics_keyword_buckets_single_scan():
+    s = score_prompt("Write a Python script, idempotent and linted")
+    assert s.context == 20 and s.constraints == 15
+
+def test_heuristic_scores_are_hashable_and_slotted():
+    s = score_prompt("write postgres stuff")
+    assert not hasattr(s, "__dict__")
+    assert {s: total(s)}[score_prompt("write postgres stuff")] == total(s)
+
+def test_heuristics_keywords_ignore_case():
+    assert score_prompt("deploy postgresql on rhel").context == 20
+    assert score_prompt("Make it IDEMPOTENT").constraints == 15
+
+def test_heuristics_rls_matches_on_word_start():
+    for word in ["curls", "hurls", "whirls"]:
+        assert score_prompt(f"Write a note about {word}").constraints == 7
+    assert score_prompt("Enforce RLS on the table").constraints == 15
+    assert score_prompt("must pass ansible-lint").constraints == 15
+    assert score_prompt("Target RHEL9 hosts").context == 20
+
+def test_heuristics_lint_tools_earn_constraints_bonus():
+    for prompt in ["Must pass yamllint and pylint", "Run eslint", "must pass ansible-lint"]:
+        assert score_prompt(prompt).constraints == 15
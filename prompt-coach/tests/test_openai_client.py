@@ -0,0 +1,190 @@
+import asyncio
+from coach import openai_client
+
+def test_get_client_reuses_connection_pool(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    a = openai_client.get_client()
+    b = openai_client.get_client()
+    assert a is b
+    assert a._client is b._client
+
+def test_get_client_rebuilt_when_key_changes(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-one")
+    a = openai_client.get_client()
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-two")
+    assert openai_client.get_client() is not a
+
+def test_async_client_cached_within_loop(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+
+    async def pair():
+        return openai_client.get_async_client(), openai_client.get_async_client()
+
+    a, b = asyncio.run(pair())
+    assert a is b
+
+class _Obj:
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
+def _chunk(content=None, usage=None):
+    choices = [] if content is None else [_Obj(delta=_Obj(content=content))]
+    return _Obj(choices=choices, usage=usage)
+
+def test_judge_and_rewrite_assembles_streamed_json(monkeypatch):
+    seen = {}
+    def create(**params):
+        seen.update(params)
+        return iter([_chunk('{"improved": '), _chunk('"better"}'),
+                     _chunk(usage=_Obj(prompt_tokens=3, completion_tokens=4, total_tokens=7))])
+    fake = _Obj(chat=_Obj(completions=_Obj(create=create)))
+    monkeypatch.setattr(openai_client, "get_client", lambda: fake)
+
+    stream = openai_client.JudgeStream("sys", "user")
+    assert list(stream) == ['{"improved": ', '"better"}']
+    data, usage = stream.result
+    assert data == {"improved": "better"}
+    assert usage.total_tokens == 7
+    assert seen["stream"] is True and seen["stream_options"] == {"include_usage": True}
+
+def test_request_params_pin_system_prompt_for_prompt_caching():
+    params = openai_client._request_params("static system", "user text", "gpt-4o-mini")
+    assert params["messages"][0] == {"role": "system", "content": "static system"}
+    assert params["prompt_cache_key"] == openai_client._request_params("static system", "other", "m")["prompt_cache_key"]
+
+def test_usage_reports_cached_prompt_tokens():
+    u = _Obj(prompt_tokens=1200, completion_tokens=10, total_tokens=1210,
+             prompt_tokens_details=_Obj(cached_tokens=1024))
+    assert openai_client._usage(u, "m").cached_tokens == 1024
+
+def test_judge_and_rewrite_multi_maps_results_by_id(monkeypatch):
+    import json
+    def fake_judge(system_prompt, user_prompt):
+        items = json.loads(user_prompt)["items"]
+        # answer out of order and drop the last item
+        return ({"results": [{"id": it["id"], "improved": it["prompt"].upper()} for it in reversed(items[:-1])]},
+                openai_client.ModelUsage(total_tokens=9, model="m"))
+    monkeypatch.setattr(openai_client, "judge_and_rewrite", fake_judge)
+    monkeypatch.setenv("PROMPT_COACH_MULTI_SIZE", "3")
+
+    res = openai_client.judge_and_rewrite_multi("sys", ["a", "b", "c", "d"])
+    assert res[0][0] == {"improved": "A"} and res[1][0] == {"improved": "B"}
+    assert res[2] is None  # dropped from the first packed request
+    assert res[3] is None  # sole item of the second request, also dropped
+    assert res[0][1].total_tokens == 3  # 9 tokens spread over the 3 packed prompts
+
+def test_async_client_negotiates_http2(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+
+    async def transport():
+        return openai_client.get_async_client()._client._transport
+
+    assert asyncio.run(transport())._pool._http2 is True
+
+def test_openai_sdk_is_imported_lazily():
+    import pathlib, subprocess, sys
+    code = "import sys, coach.scorer; assert 'openai' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], check=True, env={"OPENAI_API_KEY": "sk-test"},
+                   cwd=pathlib.Path(__file__).resolve().parents[1])
+
+def test_create_retries_rate_limits(monkeypatch):
+    import httpx, openai
+    from tenacity import wait_none
+    monkeypatch.setattr(openai_client._create.retry, "wait", wait_none())
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    attempts = []
+    def create(**params):
+        attempts.append(params)
+        if len(attempts) < 3:
+            raise openai.RateLimitError("slow down", response=httpx.Response(429, request=request), body=None)
+        return "ok"
+    fake = _Obj(chat=_Obj(completions=_Obj(create=create)))
+
+    assert openai_client._create(fake, model="m") == "ok"
+    assert len(attempts) == 3
+
+def test_sdk_retries_disabled_in_favour_of_tenacity(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    assert openai_client.get_client().max_retries == 0
+
+    async def client():
+        return openai_client.get_async_client()
+
+    assert asyncio.run(client()).max_retries == 0
+
+def test_judge_and_rewrite_batch_reads_output_and_error_files(monkeypatch):
+    import json
+    ok = {"custom_id": "0", "response": {"status_code": 200, "body": {
+        "choices": [{"message": {"content": '{"improved": "x"}'}}], "usage": {"total_tokens": 5}}}}
+    failed = {"custom_id": "1", "response": {"status_code": 400, "body": {
+        "error": {"message": "bad request"}}}, "error": None}
+    files = {"out": json.dumps(ok), "err": json.dumps(failed)}
+    batch = _Obj(id="b1", status="completed", output_file_id="out", error_file_id="err")
+    fake = _Obj(
+        files=_Obj(create=lambda **kw: _Obj(id="in"), content=lambda fid: _Obj(text=files[fid])),
+        batches=_Obj(create=lambda **kw: batch, retrieve=lambda bid: batch),
+    )
+    monkeypatch.setattr(openai_client, "get_client", lambda: fake)
+
+    res = openai_client.judge_and_rewrite_batch("sys", ["a", "b"], poll_interval=0)
+    assert res[0][0] == {"improved": "x"} and res[0][1].total_tokens == 5
+    assert res[1][0] == {"error": "batch request failed: bad request"}
+
+def test_judge_and_rewrite_batch_skips_empty_input(monkeypatch):
+    monkeypatch.setattr(openai_client, "get_client", lambda: (_ for _ in ()).throw(AssertionError("no client")))
+    assert openai_client.judge_and_rewrite_batch("sys", []) == []
+
+def test_judge_and_rewrite_batch_retries_transient_poll_errors(monkeypatch):
+    import httpx, openai
+    from tenacity import wait_none
+    monkeypatch.setattr(openai_client._call.retry, "wait", wait_none())
+    request = httpx.Request("GET", "https://api.openai.com/v1/batches/b1")
+    polls = []
+    def retrieve(bid):
+        polls.append(bid)
+        if len(polls) == 1:
+            raise openai.InternalServerError("oops", response=httpx.Response(502, request=request), body=None)
+        return _Obj(id="b1", status="completed", output_file_id=None, error_file_id=None)
+    fake = _Obj(
+        files=_Obj(create=lambda **kw: _Obj(id="in")),
+        batches=_Obj(create=lambda **kw: _Obj(id="b1", status="in_progress"), retrieve=retrieve),
+    )
+    monkeypatch.setattr(openai_client, "get_client", lambda: fake)
+
+    res = openai_client.judge_and_rewrite_batch("sys", ["a"], poll_interval=0)
+    assert len(polls) == 2
+    assert res[0][0] == {"error": "no result returned by batch"}
+
+def test_judge_and_rewrite_batch_resubmits_without_temperature(monkeypatch):
+    import json
+    uploads = []
+    def upload(file, purpose):
+        uploads.append([json.loads(line)["body"] for line in file[1].decode().splitlines()])
+        return _Obj(id=str(len(uploads)))
+    def content(fid):
+        if fid == "err1":
+            return _Obj(text=json.dumps({"custom_id": "0", "response": {"status_code": 400, "body": {
+                "error": {"message": "Unsupported value: 'temperature' does not support 0.2"}}}}))
+        return _Obj(text=json.dumps({"custom_id": "0", "response": {"status_code": 200, "body": {
+            "choices": [{"message": {"content": '{"improved": "x"}'}}]}}}))
+    def create(input_file_id, **kw):
+        return _Obj(id="b" + input_file_id, status="completed", output_file_id=None if input_file_id == "1" else "out2",
+                    error_file_id="err1" if input_file_id == "1" else None)
+    fake = _Obj(files=_Obj(create=upload, content=content), batches=_Obj(create=create))
+    monkeypatch.setattr(openai_client, "get_client", lambda: fake)
+
+    res = openai_client.judge_and_rewrite_batch("sys", ["a"], poll_interval=0)
+    assert res[0][0] == {"improved": "x"}
+    assert "temperature" in uploads[0][0] and "temperature" not in uploads[1][0]
+
+def test_judge_and_rewrite_many_keeps_results_when_one_item_fails(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    async def fake_async(system_prompt, prompt, client=None):
+        if prompt == "bad":
+            raise ValueError("content policy")
+        return {"improved": prompt}, openai_client.ModelUsage(model="m")
+    monkeypatch.setattr(openai_client, "judge_and_rewrite_async", fake_async)
+
+    res = asyncio.run(openai_client.judge_and_rewrite_many("sys", ["a", "bad", "c"]))
+    assert [r[0] for r in res] == [{"improved": "a"}, {"error": "model request failed: content policy"},
+                                   {"improved": "c"}]
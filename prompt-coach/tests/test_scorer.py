@@ -0,0 +1,123 @@
+import asyncio
+from coach import scorer
+from coach.utils import ModelUsage
+
+def test_score_and_improve_many_keeps_order(monkeypatch):
+    async def fake_many(system_prompt, prompts):
+        return [({"scorecard": {"total": 80}, "improved": p.upper()}, ModelUsage(total_tokens=1, model="m"))
+                for p in prompts]
+    monkeypatch.setattr(scorer, "judge_and_rewrite_many", fake_many)
+
+    res = asyncio.run(scorer.score_and_improve_many(["first prompt", "second prompt"]))
+    assert [r["improved"] for r in res] == ["FIRST PROMPT", "SECOND PROMPT"]
+    assert all(r["model_score"] == 80 for r in res)
+
+def test_model_cache_serves_repeat_prompts(monkeypatch):
+    calls = []
+    def fake_judge(system_prompt, prompt):
+        calls.append(prompt)
+        return {"scorecard": {"total": 70}, "improved": "better", "notes": []}, ModelUsage(total_tokens=42, model="m")
+    monkeypatch.setattr(scorer, "judge_and_rewrite", fake_judge)
+    monkeypatch.setattr(scorer, "_MODEL_CACHE", scorer.OrderedDict())
+    monkeypatch.setenv("PROMPT_COACH_CACHE", "1")
+    monkeypatch.delenv("PROMPT_COACH_CACHE_DIR", raising=False)
+
+    first = scorer.score_and_improve("write postgres stuff")
+    first["notes"].append("mutated by caller")
+    second = scorer.score_and_improve("write postgres stuff")
+    assert len(calls) == 1
+    assert second["improved"] == "better" and second["notes"] == []
+    assert second["usage"]["total_tokens"] == 0
+
+def test_model_cache_evicts_oldest(monkeypatch):
+    monkeypatch.setattr(scorer, "judge_and_rewrite",
+                        lambda s, p: ({"improved": p}, ModelUsage(model="m")))
+    monkeypatch.setattr(scorer, "_MODEL_CACHE", scorer.OrderedDict())
+    monkeypatch.setenv("PROMPT_COACH_CACHE", "1")
+    monkeypatch.setenv("PROMPT_COACH_CACHE_SIZE", "2")
+    monkeypatch.delenv("PROMPT_COACH_CACHE_DIR", raising=False)
+
+    for p in ["a", "b", "c"]:
+        scorer.score_and_improve(p)
+    assert len(scorer._MODEL_CACHE) == 2
+
+def test_score_and_improve_async_merges_local_and_model(monkeypatch):
+    async def fake_judge(system_prompt, prompt):
+        return {"scorecard": {"total": 90}, "improved": "better"}, ModelUsage(total_tokens=5, model="m")
+    monkeypatch.setattr(scorer, "judge_and_rewrite_async", fake_judge)
+    monkeypatch.delenv("PROMPT_COACH_CACHE", raising=False)
+
+    res = asyncio.run(scorer.score_and_improve_async("write postgres stuff"))
+    assert res["model_score"] == 90
+    assert res["final_score"] == round((res["local_score"] + 90) / 2)
+
+def test_score_and_improve_multi_maps_ids_and_falls_back(monkeypatch):
+    def fake_multi(system_prompt, prompts):
+        assert system_prompt == scorer.MULTI_SYSTEM_PROMPT
+        return [({"improved": "packed-0"}, ModelUsage(model="m")), None]
+    single = []
+    def fake_judge(system_prompt, prompt):
+        single.append(prompt)
+        return {"improved": "single"}, ModelUsage(model="m")
+    monkeypatch.setattr(scorer, "judge_and_rewrite_multi", fake_multi)
+    monkeypatch.setattr(scorer, "judge_and_rewrite", fake_judge)
+
+    res = scorer.score_and_improve_multi(["first", "second"])
+    assert [r["improved"] for r in res] == ["packed-0", "single"]
+    assert single == ["second"]
+
+def test_long_prompt_truncated_before_model_call(monkeypatch):
+    sent = []
+    def fake_judge(system_prompt, prompt):
+        sent.append(prompt)
+        return {"improved": "short"}, ModelUsage(model="m")
+    monkeypatch.setattr(scorer, "judge_and_rewrite", fake_judge)
+    monkeypatch.delenv("PROMPT_COACH_CACHE", raising=False)
+    budget = 500
+    monkeypatch.setenv("PROMPT_COACH_CONTEXT_TOKENS", str(budget + 100 + scorer._system_tokens(scorer.get_model())))
+    monkeypatch.setenv("PROMPT_COACH_RESPONSE_TOKENS", "100")
+
+    res = scorer.score_and_improve("word " * 5000)
+    assert scorer.count_tokens(sent[0]) <= budget
+    assert "truncated" in res["notes"][0]
+
+    scorer.score_and_improve("write postgres stuff")
+    assert sent[1] == "write postgres stuff"
+
+def test_model_cache_disk_hits_respect_size_and_system_prompt(monkeypatch, tmp_path):
+    monkeypatch.setattr(scorer, "judge_and_rewrite",
+                        lambda s, p: ({"improved": p}, ModelUsage(model="m")))
+    monkeypatch.setattr(scorer, "_MODEL_CACHE", scorer.OrderedDict())
+    monkeypatch.setenv("PROMPT_COACH_CACHE", "1")
+    monkeypatch.setenv("PROMPT_COACH_CACHE_DIR", str(tmp_path))
+    for p in ["a", "b", "c"]:
+        scorer.score_and_improve(p)
+
+    # fresh process: only the disk layer is warm
+    monkeypatch.setattr(scorer, "_MODEL_CACHE", scorer.OrderedDict())
+    monkeypatch.setenv("PROMPT_COACH_CACHE_SIZE", "2")
+    monkeypatch.setattr(scorer, "judge_and_rewrite", lambda s, p: (_ for _ in ()).throw(AssertionError("miss")))
+    for p in ["a", "b", "c"]:
+        assert scorer.score_and_improve(p)["improved"] == p
+    assert len(scorer._MODEL_CACHE) == 2
+
+    # a changed system prompt must not reuse old entries
+    monkeypatch.setattr(scorer, "_SYSTEM_DIGEST", b"\0" * 16)
+    assert scorer._cache_lookup("a")[1] is None
+
+def test_score_and_improve_batch_marks_failed_rows(monkeypatch):
+    def fake_batch(system_prompt, prompts):
+        return [({"scorecard": {"total": 80}, "improved": "ok"}, ModelUsage(model="m")),
+                ({"error": "batch request failed: bad request"}, ModelUsage(model="m"))]
+    monkeypatch.setattr(scorer, "judge_and_rewrite_batch", fake_batch)
+
+    ok, failed = scorer.score_and_improve_batch(["first prompt", "second prompt"])
+    assert ok["improved"] == "ok" and "error" not in ok
+    assert failed["error"] == "batch request failed: bad request"
+    assert "final_score" not in failed and "improved" not in failed
+
+def test_fit_prompt_skips_tokenizer_for_short_prompts(monkeypatch):
+    def no_tokenizer(model):
+        raise AssertionError("system prompt tokens counted for a short prompt")
+    monkeypatch.setattr(scorer, "_system_tokens", no_tokenizer)
+    assert scorer._fit_prompt("write postgres stuff") == ("write postgres stuff", None)
@@ -0,0 +1,10 @@
+import pytest
+
+def test_score_batch_rejects_oversized_lists(monkeypatch):
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+    import server
+    monkeypatch.setenv("PROMPT_COACH_MAX_BATCH_ITEMS", "2")
+
+    r = TestClient(server.app).post("/score_batch", json=[{"text": "a"}, {"text": "b"}, {"text": "c"}])
+    assert r.status_code == 413
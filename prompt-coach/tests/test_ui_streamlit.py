@@ -0,0 +1,49 @@
+import importlib, pathlib, sys
+import pytest
+
+pytest.importorskip("streamlit")
+
+@pytest.fixture(scope="module")
+def ui():
+    # Importing the page runs it in Streamlit's bare mode; no button is pressed so no model call happens
+    sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "tools"))
+    try:
+        yield importlib.import_module("ui_streamlit")
+    finally:
+        sys.path.pop(0)
+
+def test_format_diff_renders_sample_diff(ui):
+    from coach.utils import unified_diff
+    out = ui._format_diff(unified_diff("write postgres stuff\n", "Act as a PostgreSQL DBA.\n"))
+    assert out.splitlines()[:2] == ["--- original", "+++ improved"]
+    assert "-write postgres stuff" in out and "+Act as a PostgreSQL DBA." in out
+
+def test_evaluate_renders_result_with_diff(monkeypatch):
+    from streamlit.testing.v1 import AppTest
+    from coach import scorer
+    from coach.utils import unified_diff
+
+    class FakeStream:
+        def __init__(self, raw_prompt):
+            improved = "[ROLE SETUP] Act as a PostgreSQL DBA.\n"
+            self.result = {"final_score": 50, "local_score": 40, "model_score": 60, "scorecard": {},
+                           "improved": improved, "diff": unified_diff(raw_prompt, improved),
+                           "verification": [], "notes": [], "usage": {"total_tokens": 0}}
+        def __iter__(self):
+            yield "{}"
+    monkeypatch.setattr(scorer, "ScoreStream", FakeStream)
+
+    at = AppTest.from_file(str(pathlib.Path(__file__).resolve().parents[1] / "tools" / "ui_streamlit.py"))
+    at.run()
+    at.button[0].click().run()
+    assert not at.error
+    assert any(c.language == "diff" and "+[ROLE SETUP]" in c.value for c in at.code)
+
+def test_format_diff_wraps_long_lines(ui):
+    line = "+" + " ".join(["word"] * 40)  # 200 characters incl. prefix
+    assert len(line) == 200
+    out = ui._format_diff("--- original\n+++ improved\n@@ -1 +1 @@\n" + line).splitlines()
+    chunks = out[3:]
+    assert len(chunks) > 1
+    assert all(c.startswith("+") and len(c) - 1 <= 80 for c in chunks)
+    assert " ".join(c[1:] for c in chunks) == line[1:]
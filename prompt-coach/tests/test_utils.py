@@ -2,3 +2,26 @@ from coach.utils import unified_diff
 def test_unified_diff_has_headers():
     d = unified_diff("a", "b")
     assert "original" in d and "improved" in d
+
+def test_unified_diff_identical_is_empty():
+    assert unified_diff("same\ntext\n", "same\ntext\n") == ""
+
+def test_safe_json_loads_falls_back_on_non_json():
+    from coach.utils import safe_json_loads
+    assert safe_json_loads('{"improved": "x"}') == {"improved": "x"}
+    assert safe_json_loads("not json")["notes"] == ["non-json model output"]
+
+def test_truncate_to_tokens_checks_multibyte_text():
+    from coach.utils import truncate_to_tokens, count_tokens
+    text = "数据库" * 40  # 120 characters, 360 UTF-8 bytes
+    out, truncated = truncate_to_tokens(text, 150, "gpt-4o-mini")
+    assert count_tokens(out, "gpt-4o-mini") <= 150
+    assert truncated or out == text
+    assert truncate_to_tokens("short", 150) == ("short", False)
+
+def test_truncate_to_tokens_fallback_cuts_on_bytes(monkeypatch):
+    from coach import utils
+    monkeypatch.setattr(utils, "get_encoding", lambda model: None)
+    out, truncated = utils.truncate_to_tokens("数据库" * 100, 100)
+    assert truncated and len(out.encode("utf-8")) <= 100
+    assert out == "数据库" * 11  # 99 bytes; the split character is dropped
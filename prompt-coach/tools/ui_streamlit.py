@@ -5,13 +5,14 @@ Run:  streamlit run tools/ui_streamlit.py
 """
 
 from __future__ import annotations
+import io
 import os
 import json
 import textwrap
 import streamlit as st
 
 # Load your package
-from coach.scorer import score_and_improve
+from coach.scorer import ScoreStream
 
 # (Optional) auto-load .env if present
 try:
@@ -94,6 +95,49 @@ if clear_btn:
         del st.session_state[key]
     st.rerun()
 
+# --- Cached helpers -------------------------------------------------------------
+# Reruns (widget changes, re-clicking Evaluate on the same prompt) reuse these
+# instead of calling the model or reformatting again. Model and timeout are
+# explicit arguments so changing them in the sidebar misses the cache.
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=128)
+def _cached_score(prompt: str, model: str, timeout_s: int) -> dict:
+    # Show the model output as it streams in, then replace it with the full result
+    stream = ScoreStream(prompt)
+    preview = st.empty()
+    preview.write_stream(stream)
+    preview.empty()
+    return stream.result
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def _format_improved(improved_text: str) -> str:
+    # Add extra line breaks before section headers for better readability
+    sections = ["[ROLE SETUP]", "[CONTEXT]", "[TASK]", "[FORMAT CONTRACT]", "[GUARDRAILS]", "[ACCEPTANCE]"]
+    formatted_text = improved_text
+    for section in sections:
+        formatted_text = formatted_text.replace(section, f"\n{section}")
+    # Remove leading newline if it exists
+    return formatted_text.lstrip("\n")
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def _format_diff(diff_text: str) -> str:
+    # Split long +/- lines into ~80-column chunks to make the diff more readable
+    sio = io.StringIO()
+    sep = ""
+    for line in diff_text.split('\n'):
+        if (line.startswith('-') or line.startswith('+')) and not line.startswith(('---', '+++')) \
+                and len(line) - 1 > 80:
+            prefix = line[0]
+            for chunk in textwrap.wrap(line[1:], width=80, break_long_words=False, break_on_hyphens=False):
+                sio.write(sep)
+                sio.write(prefix)
+                sio.write(chunk)
+                sep = "\n"
+        else:
+            sio.write(sep)
+            sio.write(line)
+            sep = "\n"
+    return sio.getvalue()
+
 # --- Evaluate -----------------------------------------------------------------
 if run_btn:
     text = prompt.strip()
@@ -102,7 +146,7 @@ if run_btn:
     else:
         try:
             with st.spinner("Scoring and improving…"):
-                result = score_and_improve(text)
+                result = _cached_score(text, model, timeout_s)
 
             # Topline metrics
             m1, m2, m3, m4 = st.columns(4)
@@ -114,77 +158,13 @@ if run_btn:
 
             # Improved prompt (copyable)
             with st.expander("✅ Improved Prompt", expanded=True):
-                improved_text = result.get("improved", "")
-                # Add extra line breaks before section headers for better readability
-                sections = ["[ROLE SETUP]", "[CONTEXT]", "[TASK]", "[FORMAT CONTRACT]", "[GUARDRAILS]", "[ACCEPTANCE]"]
-                formatted_text = improved_text
-                for section in sections:
-                    formatted_text = formatted_text.replace(section, f"\n{section}")
-                # Remove leading newline if it exists
-                formatted_text = formatted_text.lstrip("\n")
-                st.code(formatted_text, language=None)
+                st.code(_format_improved(result.get("improved", "")), language=None)
 
             # Before/After diff
             with st.expander("🧾 Before/After Diff"):
                 diff_text = result.get("diff", "")
                 if diff_text:
-                    # Process the diff to make it more readable
-                    lines = diff_text.split('\n')
-                    formatted_diff = []
-
-                    for line in lines:
-                        if line.startswith('---') or line.startswith('+++') or line.startswith('@@'):
-                            formatted_diff.append(line)
-                        elif line.startswith('-'):
-                            # Split long removed lines into chunks for better readability
-                            content = line[1:]  # Remove the '-' prefix
-                            if len(content) > 80:
-                                words = content.split()
-                                chunks = []
-                                current_chunk = []
-                                current_length = 0
-
-                                for word in words:
-                                    if current_length + len(word) + 1 > 80 and current_chunk:
-                                        chunks.append('-' + ' '.join(current_chunk))
-                                        current_chunk = [word]
-                                        current_length = len(word)
-                                    else:
-                                        current_chunk.append(word)
-                                        current_length += len(word) + 1
-
-                                if current_chunk:
-                                    chunks.append('-' + ' '.join(current_chunk))
-                                formatted_diff.extend(chunks)
-                            else:
-                                formatted_diff.append(line)
-                        elif line.startswith('+'):
-                            # Split long added lines into chunks for better readability
-                            content = line[1:]  # Remove the '+' prefix
-                            if len(content) > 80:
-                                words = content.split()
-                                chunks = []
-                                current_chunk = []
-                                current_length = 0
-
-                                for word in words:
-                                    if current_length + len(word) + 1 > 80 and current_chunk:
-                                        chunks.append('+' + ' '.join(current_chunk))
-                                        current_chunk = [word]
-                                        current_length = len(word)
-                                    else:
-                                        current_chunk.append(word)
-                                        current_length += len(word) + 1
-
-                                if current_chunk:
-                                    chunks.append('+' + ' '.join(current_chunk))
-                                formatted_diff.extend(chunks)
-                            else:
-                                formatted_diff.append(line)
-                        else:
-                            formatted_diff.append(line)
-
-                    st.code('\n'.join(formatted_diff), language="diff")
+                    st.code(_format_diff(diff_text), language="diff")
                 else:
                     st.write("No changes detected")
 